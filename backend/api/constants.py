@@ -0,0 +1,22 @@
+# Настройки API
+DEFAULT_RECIPES_LIMIT = 100
+MAX_RECIPES_LIMIT = 100
+BULK_CREATE_BATCH_SIZE = 500
+RECIPE_IMAGE_UPLOAD_DIR = 'recipes/uploads/'
+# Форматы Pillow, принимаемые при загрузке изображения, и их расширения
+RECIPE_IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+INGREDIENTS_CACHE_TIMEOUT = 60 * 60
+UUID_PATTERN = (
+    '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+)
+SHOPPING_LIST_CHUNK_SIZE = 500
+PAGINATION_COUNT_CACHE_TIMEOUT = 5 * 60
+SHOPPING_LIST_EXPORT_TIMEOUT = 10 * 60
+# Неиспользуемые загрузки изображений: срок хранения и лимит на пользователя
+RECIPE_UPLOAD_MAX_AGE = 24 * 60 * 60
+RECIPE_UPLOAD_USER_LIMIT = 20
@@ -0,0 +1,31 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.constants import RECIPE_IMAGE_UPLOAD_DIR, RECIPE_UPLOAD_MAX_AGE
+from api.uploads import delete_stale_uploads, get_upload_dir
+
+
+class Command(BaseCommand):
+    help = "Удаление загруженных изображений, не привязанных к рецептам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=RECIPE_UPLOAD_MAX_AGE // 3600,
+            help='Удалять загрузки старше указанного числа часов'
+        )
+
+    def handle(self, *args, **options):
+        if not default_storage.exists(RECIPE_IMAGE_UPLOAD_DIR):
+            return
+        max_age = options['hours'] * 3600
+        count = 0
+        for user_id in default_storage.listdir(RECIPE_IMAGE_UPLOAD_DIR)[0]:
+            upload_dir = get_upload_dir(user_id)
+            before = len(default_storage.listdir(upload_dir)[1])
+            delete_stale_uploads(upload_dir, max_age)
+            count += before - len(default_storage.listdir(upload_dir)[1])
+        self.stdout.write(
+            self.style.SUCCESS(f"Удалено загрузок: {count}")
+        )
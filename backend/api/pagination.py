@@ -1,4 +1,10 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+import hashlib
+
+from .constants import PAGINATION_COUNT_CACHE_TIMEOUT
 
 
 class CustomPagePagination(PageNumberPagination):
@@ -7,3 +13,82 @@ class CustomPagePagination(PageNumberPagination):
     page_query_param = 'page'
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор, хранящий результат COUNT(*) в кэше.
+
+    Ключ строится по SQL выборки, поэтому учитывает фильтры
+    и текущего пользователя. При refresh количество
+    пересчитывается и перезаписывается в кэше.
+    """
+
+    def __init__(self, object_list, per_page, refresh=False, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.refresh = refresh
+
+    @cached_property
+    def count(self):
+        key = 'pagination-count:' + hashlib.md5(
+            str(self.object_list.query).encode()
+        ).hexdigest()
+        count = None if self.refresh else cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class CachedCountPagePagination(CustomPagePagination):
+    """Постраничная пагинация с кэшированным количеством объектов.
+
+    Первая страница всегда считает количество заново, остальные
+    страницы берут его из кэша.
+    """
+
+    refresh_count = True
+
+    def django_paginator_class(self, object_list, per_page):
+        return CachedCountPaginator(
+            object_list, per_page, refresh=self.refresh_count
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.refresh_count = request.query_params.get(
+            self.page_query_param, '1'
+        ) == '1'
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация рецептов по дате публикации"""
+
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'limit'
+    page_size = 6
+
+
+class RecipePagination(CachedCountPagePagination):
+    """Пагинация рецептов.
+
+    По умолчанию постраничная, как у остального API. Если передан
+    параметр cursor (в том числе пустой), выборка идет курсором
+    по индексу created_at без OFFSET, что не замедляется на
+    глубоких страницах.
+    """
+
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = RecipeCursorPagination()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,3 +1,6 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.functional import cached_property
 from djoser.serializers import (
     UserSerializer as DjoserUserSerializer
 )
@@ -6,24 +9,59 @@ from djoser.serializers import (
 )
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from urllib.parse import urlparse
+import copy
+import posixpath
 import re
-
+import uuid
+
+from recipes.constants import (
+    EMAIL_MAX_LENGTH,
+    MAX_VALUE,
+    MIN_VALUE,
+    NAME_MAX_LENGTH,
+    RECIPE_NAME_MAX_LENGTH,
+)
 from recipes.models import (
-    Favorite,
     Ingredient,
     IngredientInRecipe,
     Recipe,
-    ShoppingCart,
     Subscription,
 )
 
-# Константы
-NAME_MAX_LENGTH = 150
-EMAIL_MAX_LENGTH = 254
-RECIPE_NAME_MAX_LENGTH = 256
-MIN_VALUE = 1
-MAX_VALUE = 32000
-DEFAULT_RECIPES_LIMIT = 100
+from .constants import (
+    BULK_CREATE_BATCH_SIZE,
+    DEFAULT_RECIPES_LIMIT,
+    RECIPE_IMAGE_EXTENSIONS,
+    RECIPE_UPLOAD_MAX_AGE,
+    RECIPE_UPLOAD_USER_LIMIT,
+)
+from .uploads import delete_stale_uploads, get_upload_dir
+
+USERNAME_RE = re.compile(r'\A[\w.@+-]+\Z')
+
+
+class CachedFieldsMixin:
+    """Кэширование полей сериализатора на уровне класса.
+
+    Интроспекция модели выполняется один раз на класс, каждый
+    экземпляр получает собственную копию готовых полей. Список
+    полей для чтения собирается один раз на экземпляр, а не при
+    сериализации каждого объекта списка.
+    """
+
+    def get_fields(self):
+        cls = type(self)
+        if '_cached_fields' not in cls.__dict__:
+            cls._cached_fields = super().get_fields()
+        return copy.deepcopy(cls._cached_fields)
+
+    @cached_property
+    def _readable_fields(self):
+        return [
+            field for field in self.fields.values()
+            if not field.write_only
+        ]
 
 
 class UserCreateSerializer(DjoserUserCreateSerializer):
@@ -45,7 +83,7 @@ class UserCreateSerializer(DjoserUserCreateSerializer):
         )
 
     def validate_username(self, value):
-        if not re.match(r'^[\w.@+-]+$', value):
+        if not USERNAME_RE.match(value):
             raise serializers.ValidationError(
                 'Username может содержать только буквы, '
                 'цифры и символы: @ . + -'
@@ -68,7 +106,7 @@ class UserCreateSerializer(DjoserUserCreateSerializer):
         return super().to_representation(instance)
 
 
-class UserSerializer(DjoserUserSerializer):
+class UserSerializer(CachedFieldsMixin, DjoserUserSerializer):
     """Сериализатор пользователя с подпиской"""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -81,14 +119,31 @@ class UserSerializer(DjoserUserSerializer):
             'is_subscribed'
         )
 
+    def get_subscribed_author_ids(self):
+        """ID авторов, на которых подписан текущий пользователь.
+
+        Выбираются одним запросом и кэшируются в контексте, общем
+        для всех вложенных сериализаторов в рамках запроса. Для
+        анонимного пользователя кэшируется пустое множество.
+        """
+        if '_subscribed_author_ids' not in self.context:
+            user = getattr(self.context.get('request'), 'user', None)
+            self.context['_subscribed_author_ids'] = (
+                frozenset(
+                    user.subscriptions.order_by()
+                    .values_list('author_id', flat=True)
+                )
+                if user is not None and user.is_authenticated
+                else frozenset()
+            )
+        return self.context['_subscribed_author_ids']
+
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or not hasattr(request, 'user'):
-            return False
-        user = request.user
-        if not user.is_authenticated:
-            return False
-        return user.subscriptions.filter(author=obj).exists()
+        # Аннотация из queryset, если пользователь выбран через него
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return obj.id in self.get_subscribed_author_ids()
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -100,6 +155,69 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ('avatar',)
 
 
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта: строка base64 или ссылка на файл,
+    загруженный текущим пользователем через RecipeImageUploadSerializer"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            path = urlparse(data).path
+            if path.startswith(settings.MEDIA_URL):
+                name = posixpath.normpath(path[len(settings.MEDIA_URL):])
+                user = self.context['request'].user
+                if (name.startswith(get_upload_dir(user.id))
+                        and default_storage.exists(name)):
+                    return name
+                raise serializers.ValidationError(
+                    'Загруженное изображение не найдено'
+                )
+        return super().to_internal_value(data)
+
+
+class RecipeImageUploadSerializer(serializers.Serializer):
+    """Загрузка изображения рецепта файлом"""
+
+    image = serializers.ImageField()
+
+    def validate_image(self, value):
+        # Расширение берется из формата, распознанного Pillow,
+        # а не из имени файла клиента
+        if value.image.format not in RECIPE_IMAGE_EXTENSIONS:
+            raise serializers.ValidationError(
+                'Допустимые форматы: '
+                + ', '.join(RECIPE_IMAGE_EXTENSIONS.values())
+            )
+        return value
+
+    def validate(self, attrs):
+        # Старые неиспользуемые загрузки пользователя удаляются,
+        # число свежих ограничено, чтобы загрузки не заполнили диск
+        fresh = delete_stale_uploads(
+            get_upload_dir(self.context['request'].user.id),
+            RECIPE_UPLOAD_MAX_AGE
+        )
+        if len(fresh) >= RECIPE_UPLOAD_USER_LIMIT:
+            raise serializers.ValidationError(
+                'Слишком много загруженных изображений без рецепта, '
+                'попробуйте позже'
+            )
+        return attrs
+
+    def create(self, validated_data):
+        image = validated_data['image']
+        extension = RECIPE_IMAGE_EXTENSIONS[image.image.format]
+        return default_storage.save(
+            f'{get_upload_dir(self.context["request"].user.id)}'
+            f'{uuid.uuid4().hex}.{extension}',
+            image
+        )
+
+    def to_representation(self, instance):
+        url = default_storage.url(instance)
+        request = self.context.get('request')
+        return {'image': request.build_absolute_uri(url) if request else url}
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиентов"""
 
@@ -108,13 +226,14 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class IngredientInRecipeSerializer(serializers.ModelSerializer):
+class IngredientInRecipeSerializer(
+    CachedFieldsMixin, serializers.ModelSerializer
+):
     """Сериализатор ингредиентов в рецепте"""
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient'
-    )
+    # Существование ингредиентов проверяется одним запросом
+    # в RecipeSerializer.validate_ingredients
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
         source='ingredient.measurement_unit'
@@ -126,16 +245,17 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Сериализатор рецептов"""
 
     author = UserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
         source='recipe_ingredients', many=True
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField(required=True)
+    is_favorited = serializers.BooleanField(read_only=True, default=False)
+    is_in_shopping_cart = serializers.BooleanField(
+        read_only=True, default=False)
+    image = RecipeImageField(required=True)
     name = serializers.CharField(
         max_length=RECIPE_NAME_MAX_LENGTH, required=True)
     text = serializers.CharField(required=True)
@@ -170,10 +290,23 @@ class RecipeSerializer(serializers.ModelSerializer):
                 'Необходимо добавить хотя бы один ингредиент'
             )
 
-        ingredient_ids = [item['ingredient'].id for item in value]
-        if len(ingredient_ids) != len(set(ingredient_ids)):
+        seen_ids = set()
+        for item in value:
+            ingredient_id = item['ingredient_id']
+            if ingredient_id in seen_ids:
+                raise serializers.ValidationError(
+                    'Ингредиенты не должны повторяться'
+                )
+            seen_ids.add(ingredient_id)
+
+        missing_ids = seen_ids - set(
+            Ingredient.objects.filter(id__in=seen_ids)
+            .values_list('id', flat=True)
+        )
+        if missing_ids:
             raise serializers.ValidationError(
-                'Ингредиенты не должны повторяться'
+                'Ингредиенты не найдены: '
+                + ', '.join(map(str, sorted(missing_ids)))
             )
 
         return value
@@ -204,38 +337,59 @@ class RecipeSerializer(serializers.ModelSerializer):
                 'ingredients': 'Необходимо добавить хотя бы один ингредиент'
             })
         ingredients_data = validated_data.pop('recipe_ingredients')
-        instance.recipe_ingredients.all().delete()
-        self.add_ingredients(instance, ingredients_data)
+        self.update_ingredients(instance, ingredients_data)
         return super().update(instance, validated_data)
 
     def add_ingredients(self, recipe, ingredients_data):
         IngredientInRecipe.objects.bulk_create(
-            IngredientInRecipe(
-                recipe=recipe,
-                ingredient=ingredient['ingredient'],
-                amount=ingredient['amount']
-            )
-            for ingredient in ingredients_data
+            [
+                IngredientInRecipe(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient['ingredient_id'],
+                    amount=ingredient['amount']
+                )
+                for ingredient in ingredients_data
+            ],
+            batch_size=BULK_CREATE_BATCH_SIZE
         )
 
-    def check_recipe_status(self, model, recipe):
-        request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and model.objects.filter(
-                user=request.user,
-                recipe=recipe
-            ).exists()
+    def update_ingredients(self, recipe, ingredients_data):
+        """Обновление ингредиентов рецепта только по изменившимся строкам"""
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()
+        }
+        amounts = {
+            item['ingredient_id']: item['amount']
+            for item in ingredients_data
+        }
+
+        removed_ids = current.keys() - amounts.keys()
+        if removed_ids:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed_ids
+            ).delete()
+
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        IngredientInRecipe.objects.bulk_update(
+            changed, ['amount'], batch_size=BULK_CREATE_BATCH_SIZE
         )
 
-    def get_is_favorited(self, obj):
-        return self.check_recipe_status(Favorite, obj)
-
-    def get_is_in_shopping_cart(self, obj):
-        return self.check_recipe_status(ShoppingCart, obj)
+        self.add_ingredients(recipe, [
+            item for item in ingredients_data
+            if item['ingredient_id'] not in current
+        ])
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(
+    CachedFieldsMixin, serializers.ModelSerializer
+):
     """Краткий сериализатор рецепта"""
 
     class Meta:
@@ -248,9 +402,7 @@ class UserWithRecipesSerializer(UserSerializer):
     """Сериализатор пользователя с рецептами"""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(
-        source='recipes.count'
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         fields = (
@@ -260,11 +412,9 @@ class UserWithRecipesSerializer(UserSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = DEFAULT_RECIPES_LIMIT
-        if request:
-            recipes_limit = int(request.GET.get(
-                'recipes_limit', DEFAULT_RECIPES_LIMIT))
+        recipes_limit = self.context.get(
+            'recipes_limit', DEFAULT_RECIPES_LIMIT
+        )
         return ShortRecipeSerializer(
             obj.recipes.all()[:recipes_limit],
             many=True
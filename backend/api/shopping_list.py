@@ -0,0 +1,61 @@
+from django.db.models import Sum
+from django.utils import timezone
+from recipes.models import IngredientInRecipe, Recipe
+
+from .constants import SHOPPING_LIST_CHUNK_SIZE
+
+
+def get_shopping_list_data(user):
+    """Ингредиенты и рецепты из списка покупок пользователя.
+
+    Строки читаются из курсора порциями и не попадают в кэш
+    результатов queryset.
+    """
+
+    # Получаем агрегированные данные одним запросом
+    ingredients_data = (
+        IngredientInRecipe.objects
+        .filter(recipe__shoppingcarts__user=user)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(total_amount=Sum('amount'))
+        .order_by('ingredient__name')
+        .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+    )
+
+    # Получаем рецепты одним запросом; рецепт попадает в корзину
+    # пользователя не больше одного раза
+    recipes_data = (
+        Recipe.objects
+        .filter(shoppingcarts__user=user)
+        .values('name', 'author__username')
+        .order_by('name')
+        .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+    )
+
+    return ingredients_data, recipes_data
+
+
+def create_shopping_report(ingredients_data, recipes_data, date):
+    """Построчное формирование отчета списка покупок"""
+    yield f'Список покупок от {date}:\n'
+    yield 'Ингредиенты:\n'
+
+    for num, ingredient in enumerate(ingredients_data, start=1):
+        name = ingredient['ingredient__name']
+        unit = ingredient['ingredient__measurement_unit']
+        amount = ingredient['total_amount']
+        yield f'{num}. {name.capitalize()} ({unit}) - {amount}\n'
+
+    yield '\nРецепты:\n'
+    for num, recipe in enumerate(recipes_data, start=1):
+        recipe_name = recipe['name']
+        author = recipe['author__username']
+        yield f'{num}. {recipe_name} (от: {author})\n'
+
+
+def build_shopping_report(user):
+    """Строки списка покупок пользователя на текущую дату"""
+    return create_shopping_report(
+        *get_shopping_list_data(user),
+        timezone.now().strftime('%d.%m.%Y')
+    )
@@ -0,0 +1,34 @@
+from celery import shared_task
+from django.core.files.base import ContentFile
+
+from recipes.models import ShoppingListExport
+
+from .shopping_list import build_shopping_report
+
+
+@shared_task
+def run_shopping_export(export_id):
+    """Формирование файла списка покупок в фоне"""
+    export = ShoppingListExport.objects.select_related('user').filter(
+        pk=export_id
+    ).first()
+    if export is None:
+        # Выгрузка удалена до запуска задачи
+        return
+    exports = ShoppingListExport.objects.filter(pk=export_id)
+    try:
+        report_text = ''.join(build_shopping_report(export.user))
+        storage = export.file.storage
+        name = storage.save(
+            export.file.field.generate_filename(export, 'shopping_list.txt'),
+            ContentFile(report_text.encode())
+        )
+    except Exception:
+        exports.update(status=ShoppingListExport.Status.FAILED)
+        raise
+    # update() не падает, если выгрузку удалили во время формирования;
+    # тогда файл сразу удаляется
+    if not exports.update(
+        status=ShoppingListExport.Status.READY, file=name
+    ):
+        storage.delete(name)
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from recipes.models import Recipe
+
+from .constants import RECIPE_IMAGE_UPLOAD_DIR
+
+
+def get_upload_dir(user_id):
+    """Каталог изображений, загруженных пользователем"""
+    return f'{RECIPE_IMAGE_UPLOAD_DIR}{user_id}/'
+
+
+def get_unused_uploads(upload_dir):
+    """Загрузки каталога, которые не указаны ни в одном рецепте"""
+    if not default_storage.exists(upload_dir):
+        return []
+    names = [
+        f'{upload_dir}{file_name}'
+        for file_name in default_storage.listdir(upload_dir)[1]
+    ]
+    used = set(
+        Recipe.objects.filter(image__in=names).values_list('image', flat=True)
+    )
+    return [name for name in names if name not in used]
+
+
+def delete_stale_uploads(upload_dir, max_age):
+    """Удаление неиспользуемых загрузок старше max_age.
+
+    Возвращает оставшиеся неиспользуемые загрузки каталога.
+    """
+    border = timezone.now() - timedelta(seconds=max_age)
+    fresh = []
+    for name in get_unused_uploads(upload_dir):
+        if default_storage.get_modified_time(name) < border:
+            default_storage.delete(name)
+        else:
+            fresh.append(name)
+    return fresh
@@ -1,12 +1,26 @@
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    BooleanField,
+    Count,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value
+)
+from django.db.models.functions import Lower
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_page
 from djoser.views import UserViewSet as DjoserUserViewSet
 from recipes.models import (
     Favorite,
     Ingredient,
+    IngredientInRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListExport,
     Subscription,
     User
 )
@@ -14,7 +28,7 @@ from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import (
     BasePermission,
     IsAuthenticated,
@@ -22,16 +36,26 @@ from rest_framework.permissions import (
 )
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-
-from .pagination import CustomPagePagination
+from datetime import timedelta
+
+from .constants import (
+    DEFAULT_RECIPES_LIMIT,
+    INGREDIENTS_CACHE_TIMEOUT,
+    MAX_RECIPES_LIMIT,
+    SHOPPING_LIST_EXPORT_TIMEOUT,
+    UUID_PATTERN,
+)
+from .pagination import CustomPagePagination, RecipePagination
 from .serializers import (
     AvatarSerializer,
     IngredientSerializer,
+    RecipeImageUploadSerializer,
     RecipeSerializer,
-    ShortRecipeSerializer,
     UserWithRecipesSerializer,
     UserSerializer
 )
+from .shopping_list import build_shopping_report
+from .tasks import run_shopping_export
 
 
 class IsAuthorOrReadOnly(BasePermission):
@@ -70,6 +94,55 @@ class UserViewSet(DjoserUserViewSet):
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        """Пользователи с признаком подписки текущего пользователя"""
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        )
+
+    def get_subscribed_authors(self, recipes_limit):
+        """Авторы из подписок с количеством и предзагрузкой рецептов"""
+        # Не больше recipes_limit последних рецептов на автора
+        # отбирается на стороне БД
+        latest_recipes = Recipe.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-created_at', '-id').values('id')[:recipes_limit]
+        # GROUP BY от Count() отключает Meta.ordering, поэтому порядок
+        # задается явно: сначала последние подписки
+        return User.objects.filter(
+            subscribers__user=self.request.user
+        ).annotate(
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('-subscribers__id').prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.filter(
+                    id__in=Subquery(latest_recipes)
+                ).only('id', 'name', 'image', 'cooking_time', 'author')
+            )
+        )
+
+    def get_recipes_limit(self):
+        """Проверка параметра recipes_limit"""
+        try:
+            recipes_limit = int(self.request.query_params.get(
+                'recipes_limit', DEFAULT_RECIPES_LIMIT
+            ))
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError({
+                'recipes_limit': 'Должно быть неотрицательным целым числом'
+            })
+        return min(recipes_limit, MAX_RECIPES_LIMIT)
+
     @action(
         detail=False,
         methods=['get'],
@@ -130,27 +203,36 @@ class UserViewSet(DjoserUserViewSet):
             )
 
         if request.method == 'POST':
-            _, created = Subscription.objects.get_or_create(
-                user=request.user,
-                author=author
-            )
-
-            if not created:
+            # Параметр проверяется до создания подписки, чтобы ошибка
+            # в нем не оставляла подписку оформленной
+            recipes_limit = self.get_recipes_limit()
+            try:
+                with transaction.atomic():
+                    Subscription.objects.create(
+                        user=request.user,
+                        author=author
+                    )
+            except IntegrityError:
                 raise ValidationError({'errors': 'Подписка уже оформлена'})
 
             return Response(
                 UserWithRecipesSerializer(
-                    author, context={'request': request}
+                    self.get_subscribed_authors(recipes_limit).get(
+                        pk=author.pk
+                    ),
+                    context={
+                        'request': request,
+                        'recipes_limit': recipes_limit,
+                    }
                 ).data,
                 status=status.HTTP_201_CREATED
             )
 
-        subscription = request.user.subscriptions.filter(author=author).first()
+        deleted, _ = request.user.subscriptions.filter(author=author).delete()
 
-        if not subscription:
+        if not deleted:
             raise ValidationError({'errors': 'Подписка не найдена'})
 
-        subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -162,33 +244,31 @@ class UserViewSet(DjoserUserViewSet):
     def get_subscriptions(self, request):
         """Список подписок пользователя"""
 
-        user = request.user
-        # Исправлено: используем правильный related_name
-        subscriptions = (
-            user.subscriptions.all()
-            .select_related('author')
+        recipes_limit = self.get_recipes_limit()
+        authors = self.paginate_queryset(
+            self.get_subscribed_authors(recipes_limit)
         )
 
-        paginator = PageNumberPagination()
-        paginator.page_size = int(request.query_params.get('limit', 6))
-        paginated_subscriptions = paginator.paginate_queryset(
-            subscriptions,
-            request
-        )
-
-        authors = [
-            subscription.author for subscription in paginated_subscriptions
-        ]
-
-        return paginator.get_paginated_response(
+        return self.get_paginated_response(
             UserWithRecipesSerializer(
                 authors,
                 many=True,
-                context={'request': request}
+                context={
+                    'request': request,
+                    'recipes_limit': recipes_limit,
+                }
             ).data
         )
 
 
+@method_decorator(
+    cache_page(INGREDIENTS_CACHE_TIMEOUT, cache='ingredients'),
+    name='list'
+)
+@method_decorator(
+    cache_page(INGREDIENTS_CACHE_TIMEOUT, cache='ingredients'),
+    name='retrieve'
+)
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """Просмотр ингредиентов"""
 
@@ -200,9 +280,20 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
         """Поиск ингредиентов по названию"""
         name = self.request.query_params.get('name')
         if name:
-            return self.queryset.filter(name__istartswith=name.lower())
+            # LOWER(name) LIKE 'abc%' использует индекс
+            # ingredient_lower_name_idx
+            return self.queryset.annotate(
+                lower_name=Lower('name')
+            ).filter(lower_name__startswith=name.lower())
         return self.queryset
 
+    def list(self, request, *args, **kwargs):
+        """Список ингредиентов без построчной сериализации"""
+        return Response(list(
+            self.filter_queryset(self.get_queryset())
+            .values(*IngredientSerializer.Meta.fields)
+        ))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Управление рецептами"""
@@ -210,25 +301,52 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    pagination_class = CustomPagePagination
+    pagination_class = RecipePagination
 
     def get_queryset(self):
         """Фильтрация рецептов"""
 
-        queryset = super().get_queryset()
-        author_id = self.request.query_params.get('author')
-        is_favorited = self.request.query_params.get('is_favorited')
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart'
+        queryset = super().get_queryset().select_related(
+            'author'
+        ).only(
+            'id', 'name', 'text', 'image', 'cooking_time', 'created_at',
+            'author__id', 'author__username', 'author__email',
+            'author__first_name', 'author__last_name', 'author__avatar',
+        ).prefetch_related(
+            Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ).only(
+                    'id', 'recipe', 'ingredient', 'amount',
+                    'ingredient__name', 'ingredient__measurement_unit',
+                )
+            )
         )
+        user = self.request.user
+        query_params = self.request.query_params
+        author_id = query_params.get('author')
+        is_favorited = query_params.get('is_favorited')
+        is_in_shopping_cart = query_params.get('is_in_shopping_cart')
         if author_id:
             queryset = queryset.filter(author__id=author_id)
-        if is_favorited == '1' and self.request.user.is_authenticated:
-            queryset = queryset.filter(favorites__user=self.request.user)
-        if is_in_shopping_cart == '1' and self.request.user.is_authenticated:
-            return queryset.filter(
-                shoppingcarts__user=self.request.user
-            )
+        if not user.is_authenticated:
+            return queryset
+
+        # Признаки и фильтры по избранному и корзине через EXISTS,
+        # без JOIN со строками избранного и корзины
+        queryset = queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+        if is_favorited == '1':
+            queryset = queryset.filter(is_favorited=True)
+        if is_in_shopping_cart == '1':
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
     def perform_create(self, serializer):
@@ -239,27 +357,34 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def handle_recipe_action(request, recipe, model):
         """Добавление/удаление рецепта в избранное или корзину"""
         if request.method == 'POST':
-            _, created = model.objects.get_or_create(
-                user=request.user,
-                recipe=recipe
-            )
-            if not created:
+            # Повтор отсекает уникальное ограничение (user, recipe),
+            # без предварительного SELECT
+            try:
+                with transaction.atomic():
+                    model.objects.create(user=request.user, recipe=recipe)
+            except IntegrityError:
                 raise ValidationError({'errors': 'Рецепт уже добавлен'})
 
+            # Те же поля, что у ShortRecipeSerializer, без создания
+            # сериализатора на каждый запрос
             return Response(
-                ShortRecipeSerializer(recipe).data,
+                {
+                    'id': recipe.id,
+                    'name': recipe.name,
+                    'image': recipe.image.url if recipe.image else None,
+                    'cooking_time': recipe.cooking_time,
+                },
                 status=status.HTTP_201_CREATED
             )
 
-        obj = model.objects.filter(
+        deleted, _ = model.objects.filter(
             user=request.user,
             recipe=recipe
-        ).first()
+        ).delete()
 
-        if not obj:
+        if not deleted:
             raise ValidationError({'errors': 'Рецепт не найден'})
 
-        obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -272,7 +397,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Добавление/удаление рецепта в избранное"""
         return self.handle_recipe_action(
             request,
-            get_object_or_404(Recipe, pk=pk),
+            get_object_or_404(
+                Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+                pk=pk
+            ),
             Favorite
         )
 
@@ -286,10 +414,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Добавление/удаление рецепта в корзину"""
         return self.handle_recipe_action(
             request,
-            get_object_or_404(Recipe, pk=pk),
+            get_object_or_404(
+                Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+                pk=pk
+            ),
             ShoppingCart
         )
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='images',
+        permission_classes=[IsAuthenticated],
+        parser_classes=[MultiPartParser]
+    )
+    def upload_image(self, request):
+        """Загрузка изображения рецепта файлом"""
+        serializer = RecipeImageUploadSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=False,
         methods=['get'],
@@ -298,75 +445,104 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_shopping_list(self, request):
         """Скачивание списка покупок"""
+        # Строки отчета отдаются клиенту по мере формирования
+        return StreamingHttpResponse(
+            build_shopping_report(request.user),
+            content_type='text/plain; charset=utf-8',
+            headers={
+                'Content-Disposition':
+                    'attachment; filename="shopping_list.txt"'
+            }
+        )
 
-        # Получаем агрегированные данные одним запросом
-        ingredients_data = (
-            request.user.shoppingcarts
-            .select_related('recipe__author')
-            .prefetch_related('recipe__recipe_ingredients__ingredient')
-            .values(
-                'recipe__recipe_ingredients__ingredient__name',
-                'recipe__recipe_ingredients__ingredient__measurement_unit'
-            )
-            .annotate(
-                total_amount=Sum('recipe__recipe_ingredients__amount')
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_list_export',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_list_export(self, request):
+        """Запуск фонового формирования списка покупок"""
+        exports = request.user.shopping_list_exports
+        with transaction.atomic():
+            # Блокировка строки пользователя не дает параллельным
+            # запросам создать несколько выгрузок
+            User.objects.select_for_update().only('id').get(
+                pk=request.user.pk
             )
-            .order_by('recipe__recipe_ingredients__ingredient__name')
+            # Пока предыдущая выгрузка формируется, новая не создается;
+            # зависшие выгрузки старше таймаута считаются устаревшими
+            export = exports.filter(
+                status=ShoppingListExport.Status.PENDING,
+                created_at__gte=timezone.now() - timedelta(
+                    seconds=SHOPPING_LIST_EXPORT_TIMEOUT
+                )
+            ).only('id').first()
+            if export is None:
+                # У пользователя хранится только последняя выгрузка,
+                # файлы удаляются сигналом post_delete
+                exports.all().delete()
+                export = ShoppingListExport.objects.create(
+                    user=request.user
+                )
+                export_id = str(export.pk)
+                # Задача запускается после фиксации, иначе воркер
+                # может не найти новую выгрузку
+                transaction.on_commit(
+                    lambda: run_shopping_export.delay(export_id)
+                )
+        return Response(
+            {'file_id': export.pk},
+            status=status.HTTP_202_ACCEPTED
         )
 
-        # Получаем рецепты одним запросом
-        recipes_data = (
-            request.user.shoppingcarts
-            .select_related('recipe__author')
-            .values('recipe__name', 'recipe__author__username')
-            .distinct()
-            .order_by('recipe__name')
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path=rf'shopping_list_export/(?P<file_id>{UUID_PATTERN})',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_list_status(self, request, file_id=None):
+        """Статус фонового формирования списка покупок"""
+        export = get_object_or_404(
+            request.user.shopping_list_exports.only('id', 'status'),
+            pk=file_id
         )
+        return Response({'file_id': export.pk, 'status': export.status})
 
-        report_text = self.create_shopping_report(
-            ingredients_data,
-            recipes_data,
-            timezone.now().strftime('%d.%m.%Y')
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path=rf'shopping_list_export/(?P<file_id>{UUID_PATTERN})/download',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_list_download(self, request, file_id=None):
+        """Скачивание списка покупок, сформированного в фоне"""
+        export = get_object_or_404(
+            request.user.shopping_list_exports,
+            pk=file_id
         )
-
+        if export.status == ShoppingListExport.Status.FAILED:
+            raise ValidationError({
+                'errors': 'Не удалось сформировать файл, '
+                          'запустите выгрузку заново'
+            })
+        if export.status != ShoppingListExport.Status.READY:
+            raise ValidationError({'errors': 'Файл еще не готов'})
         return FileResponse(
-            report_text,
+            export.file.open('rb'),
             content_type='text/plain',
             filename='shopping_list.txt'
         )
 
-    def create_shopping_report(self, ingredients_data, recipes_data, date):
-        """Формирование отчета списка покупок"""
-        report_lines = [
-            f'Список покупок от {date}:',
-            'Ингредиенты:',
-        ]
-
-        for num, ingredient in enumerate(ingredients_data, start=1):
-            name = ingredient['recipe__recipe_ingredients__ingredient__name']
-            unit = ingredient[
-                'recipe__recipe_ingredients__ingredient__measurement_unit'
-            ]
-            amount = ingredient['total_amount']
-            report_lines.append(
-                f'{num}. '
-                f'{name.capitalize()} ({unit}) - {amount}'
-            )
-
-        report_lines.append('\nРецепты:')
-        for num, recipe in enumerate(recipes_data, start=1):
-            recipe_name = recipe['recipe__name']
-            author = recipe['recipe__author__username']
-            report_lines.append(
-                f'{num}. {recipe_name} (от: {author})'
-            )
-
-        return '\n'.join(report_lines)
-
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_short_link(self, request, pk=None):
         """Получение короткой ссылки на рецепт"""
-        get_object_or_404(Recipe, pk=pk)
+        # isdigit() без isascii() пропускает символы вроде '²'
+        if not (pk.isascii() and pk.isdigit()) or not (
+            Recipe.objects.filter(pk=pk).exists()
+        ):
+            raise Http404
         short_link = request.build_absolute_uri(
             reverse('recipes:recipe-short-link', args=[pk])
         )
@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # ETag и ответ 304 для повторных GET-запросов
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -93,11 +95,40 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', '1234'),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Соединения переиспользуются между запросами воркера
+        # (встроенного пула в Django 3.2 нет)
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
 }
 
 
+# Кэш. Список ингредиентов хранится в отдельном кэше,
+# который целиком сбрасывается при изменении ингредиентов.
+# Для нескольких воркеров нужен общий бэкенд (например, Redis),
+# иначе сброс затронет только кэш текущего процесса.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+    'ingredients': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('INGREDIENTS_CACHE_LOCATION', 'ingredients'),
+    },
+}
+
+
+# Фоновые задачи. Без брокера задачи выполняются сразу в процессе
+# веб-приложения, статус выгрузки хранится в ShoppingListExport.
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', '')
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_TASK_IGNORE_RESULT = True
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -137,6 +168,8 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы, которые отдаются только через API после проверки прав
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private')
 
 STATICFILES_DIRS = []
 
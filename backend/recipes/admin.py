@@ -1,5 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import (
+    Count,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Subquery
+)
+from django.db.models.functions import Coalesce
+from django.utils.html import format_html_join
 from django.utils.safestring import mark_safe
 from .models import (
     User,
@@ -8,10 +17,26 @@ from .models import (
     Ingredient,
     IngredientInRecipe,
     Favorite,
-    ShoppingCart
+    ShoppingCart,
+    ShoppingListExport
 )
 
 
+def count_related(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на объект"""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     """Админка для пользователей"""
@@ -28,17 +53,29 @@ class CustomUserAdmin(UserAdmin):
         return 'Нет аватара'
     get_avatar_preview.short_description = 'Аватар'
 
+    def get_queryset(self, request):
+        # Счетчики считаются отдельными подзапросами: JOIN трех
+        # связей размножил бы строки пользователя
+        return super().get_queryset(request).annotate(
+            _recipes_count=count_related(Recipe, 'author'),
+            _subscriptions_count=count_related(Subscription, 'user'),
+            _followers_count=count_related(Subscription, 'author'),
+        )
+
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj._recipes_count
     get_recipes_count.short_description = 'Количество рецептов'
+    get_recipes_count.admin_order_field = '_recipes_count'
 
     def get_subscriptions_count(self, obj):
-        return obj.users.count()
+        return obj._subscriptions_count
     get_subscriptions_count.short_description = 'Подписок'
+    get_subscriptions_count.admin_order_field = '_subscriptions_count'
 
     def get_followers_count(self, obj):
-        return obj.authors.count()
+        return obj._followers_count
     get_followers_count.short_description = 'Подписчиков'
+    get_followers_count.admin_order_field = '_followers_count'
 
     list_display = (
         'id',
@@ -76,13 +113,30 @@ class IngredientAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     """Админка рецептов"""
 
+    def get_queryset(self, request):
+        # Описание рецепта в списке не выводится, ингредиенты всех
+        # рецептов страницы загружаются одним запросом
+        return super().get_queryset(request).defer('text').annotate(
+            _favorites_count=count_related(Favorite, 'recipe'),
+        ).prefetch_related(
+            Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
     def get_ingredients_list(self, obj):
-        ingredients = obj.recipe_ingredients.all()
-        return mark_safe('<br>'.join([
-            f'{ing.ingredient.name} - {ing.amount} '
-            f'{ing.ingredient.measurement_unit}'
-            for ing in ingredients
-        ]))
+        return format_html_join(
+            mark_safe('<br>'),
+            '{} - {} {}',
+            (
+                (ing.ingredient.name, ing.amount,
+                 ing.ingredient.measurement_unit)
+                for ing in obj.recipe_ingredients.all()
+            )
+        )
     get_ingredients_list.short_description = 'Ингредиенты'
 
     def get_image_preview(self, obj):
@@ -94,8 +148,9 @@ class RecipeAdmin(admin.ModelAdmin):
     get_image_preview.short_description = 'Изображение'
 
     def get_favorites_count(self, obj):
-        return obj.favorites.count()
+        return obj._favorites_count
     get_favorites_count.short_description = 'В избранном у'
+    get_favorites_count.admin_order_field = '_favorites_count'
 
     list_display = (
         'id',
@@ -126,3 +181,16 @@ class RecipeListAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
     search_fields = ('user__email', 'recipe__name')
     list_filter = ('user',)
+
+
+@admin.register(ShoppingListExport)
+class ShoppingListExportAdmin(admin.ModelAdmin):
+    """Админка выгрузок списка покупок"""
+
+    list_display = ('id', 'user', 'status', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('user__email',)
+    list_select_related = ('user',)
+    readonly_fields = ('id', 'created_at')
+    # Файл не публикуется в MEDIA_URL, ссылка на него в форме не работает
+    exclude = ('file',)
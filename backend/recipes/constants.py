@@ -0,0 +1,9 @@
+# Ограничения полей моделей, общие для моделей и сериализаторов API
+NAME_MAX_LENGTH = 150
+EMAIL_MAX_LENGTH = 254
+INGREDIENT_NAME_MAX_LENGTH = 128
+MEASUREMENT_UNIT_MAX_LENGTH = 64
+RECIPE_NAME_MAX_LENGTH = 256
+MIN_VALUE = 1
+MAX_VALUE = 32000
+EXPORT_STATUS_MAX_LENGTH = 16
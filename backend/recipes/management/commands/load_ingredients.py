@@ -1,5 +1,6 @@
 import json
 import os
+from django.core.cache import caches
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from recipes.models import Ingredient
@@ -19,6 +20,8 @@ class Command(BaseCommand):
             count = len(Ingredient.objects.bulk_create(
                 Ingredient(**item) for item in json.load(file)
             ))
+        # bulk_create не отправляет сигналы, сбрасываем кэш вручную
+        caches['ingredients'].clear()
 
         self.stdout.write(
             self.style.SUCCESS(f"Загружено ингредиентов: {count}")
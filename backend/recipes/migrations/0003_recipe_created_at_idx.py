@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-14 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_auto_20250612_0259'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-created_at'], name='recipe_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.16 on 2026-10-14 14:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListExport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'В обработке'), ('ready', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('file', models.FileField(blank=True, upload_to='shopping_lists/', verbose_name='Файл')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка списка покупок',
+                'verbose_name_plural': 'Выгрузки списка покупок',
+                'ordering': ('-created_at',),
+                'default_related_name': 'shopping_list_exports',
+            },
+        ),
+        migrations.AddField(
+            model_name='shoppinglistexport',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_exports', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаление повторных строк перед добавлением ограничений"""
+    for model_name in ('Favorite', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        keep_ids = model.objects.values('user', 'recipe').annotate(
+            keep_id=Min('id')
+        ).values('keep_id')
+        model.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistexport'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_recipe_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_recipe_shoppingcart'),
+        ),
+    ]
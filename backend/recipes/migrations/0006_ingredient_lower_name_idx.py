@@ -0,0 +1,32 @@
+from django.db import migrations
+
+INDEX_NAME = 'ingredient_lower_name_idx'
+
+
+def create_index(apps, schema_editor):
+    """Индекс для поиска ингредиентов по началу названия в PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # text_pattern_ops позволяет использовать индекс для LIKE 'abc%'
+    # при любой локали базы данных
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_ingredient '
+        '(LOWER(name) text_pattern_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_unique_user_recipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
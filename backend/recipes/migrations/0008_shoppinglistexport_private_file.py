@@ -0,0 +1,31 @@
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+import recipes.models
+
+
+def delete_public_exports(apps, schema_editor):
+    """Удаление выгрузок, файлы которых лежат в MEDIA_ROOT"""
+    ShoppingListExport = apps.get_model('recipes', 'ShoppingListExport')
+    for name in ShoppingListExport.objects.exclude(
+        file=''
+    ).values_list('file', flat=True):
+        default_storage.delete(name)
+    ShoppingListExport.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_author_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_public_exports, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name='shoppinglistexport',
+            name='file',
+            field=models.FileField(blank=True, storage=recipes.models.get_export_storage, upload_to=recipes.models.get_export_file_name, verbose_name='Файл'),
+        ),
+    ]
@@ -1,17 +1,22 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.core.files.storage import FileSystemStorage
 from django.core.validators import (RegexValidator,
                                     MinValueValidator,
                                     MaxValueValidator)
 from django.db import models
+import uuid
 
-# Константы
-NAME_MAX_LENGTH = 150
-EMAIL_MAX_LENGTH = 254
-INGREDIENT_NAME_MAX_LENGTH = 128
-MEASUREMENT_UNIT_MAX_LENGTH = 64
-RECIPE_NAME_MAX_LENGTH = 256
-MIN_VALUE = 1
-MAX_VALUE = 32000
+from .constants import (
+    EMAIL_MAX_LENGTH,
+    EXPORT_STATUS_MAX_LENGTH,
+    INGREDIENT_NAME_MAX_LENGTH,
+    MAX_VALUE,
+    MEASUREMENT_UNIT_MAX_LENGTH,
+    MIN_VALUE,
+    NAME_MAX_LENGTH,
+    RECIPE_NAME_MAX_LENGTH,
+)
 
 
 class User(AbstractUser):
@@ -168,6 +173,13 @@ class Recipe(models.Model):
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at',)
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(fields=['-created_at'], name='recipe_created_at_idx'),
+            models.Index(
+                fields=['author', '-created_at'],
+                name='recipe_author_created_at_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} (ID: {self.id})'
@@ -263,3 +275,62 @@ class ShoppingCart(RecipeUserBase):
     class Meta(RecipeUserBase.Meta):
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепты в корзине'
+
+
+def get_export_storage():
+    """Хранилище выгрузок вне MEDIA_ROOT, файлы отдаются только через API"""
+    return FileSystemStorage(location=settings.PRIVATE_MEDIA_ROOT)
+
+
+def get_export_file_name(instance, filename):
+    """Случайное имя файла выгрузки, не связанное с ее id"""
+    return f'shopping_lists/{uuid.uuid4().hex}.txt'
+
+
+class ShoppingListExport(models.Model):
+    """Файл списка покупок, сформированный фоновой задачей"""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В обработке'
+        READY = 'ready', 'Готов'
+        FAILED = 'failed', 'Ошибка'
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=EXPORT_STATUS_MAX_LENGTH,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+
+    file = models.FileField(
+        verbose_name='Файл',
+        upload_to=get_export_file_name,
+        storage=get_export_storage,
+        blank=True
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списка покупок'
+        ordering = ('-created_at',)
+        default_related_name = 'shopping_list_exports'
+
+    def __str__(self):
+        return f'{self.user.username}: {self.get_status_display()}'
@@ -1,13 +1,18 @@
-from django.db.models.signals import post_save
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.contrib.auth import get_user_model
 
-User = get_user_model()
+from .models import Ingredient, ShoppingListExport
 
 
-@receiver(post_save, sender=User)
-def handle_user_creation(sender, instance, created, **kwargs):
-    """Обработка создания нового пользователя"""
-    if created:
-        # Дополнительная логика при создании пользователя
-        pass
+@receiver([post_save, post_delete], sender=Ingredient)
+def clear_ingredients_cache(sender, **kwargs):
+    """Сброс кэша списка ингредиентов при их изменении"""
+    caches['ingredients'].clear()
+
+
+@receiver(post_delete, sender=ShoppingListExport)
+def delete_shopping_list_file(sender, instance, **kwargs):
+    """Удаление файла выгрузки вместе с записью"""
+    if instance.file:
+        instance.file.delete(save=False)
@@ -1,3 +1,4 @@
+from django.http import Http404
 from django.shortcuts import redirect
 from django.urls import reverse
 from rest_framework.views import APIView
@@ -10,5 +11,6 @@ class RecipeShortLinkView(APIView):
 
     def get(self, request, pk):
         """Редирект на полную ссылку рецепта"""
-        Recipe.objects.get(pk=pk)
+        if not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
         return redirect(reverse('recipes-detail', args=[pk]))